@@ -1,12 +1,19 @@
 import sys
 from PyQt6.QtWidgets import QApplication
 from ytdownloader.ui.main_window import MainWindow # We'll create this next
+from ytdownloader.utils.tracing import export_trace
+from ytdownloader.core.concurrency import format_metrics
 
 def run_app():
     app = QApplication(sys.argv)
     main_win = MainWindow()
     main_win.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    print(format_metrics())
+    trace_path = export_trace() # No-op unless YTDOWNLOADER_TRACE_DIR is set
+    if trace_path:
+        print(f"Trace written to {trace_path}")
+    sys.exit(exit_code)
 
 if __name__ == '__main__':
     run_app()
@@ -0,0 +1,212 @@
+import threading
+import time
+from email.utils import formatdate
+from urllib.error import HTTPError
+
+import pytest
+
+from ytdownloader.core import concurrency
+from ytdownloader.core.concurrency import AdaptiveConcurrencyController, ThrottledError, parse_retry_after
+
+
+class BotCheck(Exception):
+    pass
+
+
+class BadUrl(Exception):
+    pass
+
+
+def make_controller(**kwargs):
+    kwargs.setdefault("cooldown", 0.0)
+    return AdaptiveConcurrencyController("test", **kwargs)
+
+
+def http_error(code, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return HTTPError("https://example.invalid", code, "error", headers, None)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0),
+    (" 7 ", 7.0),
+    ("", None),
+    (None, None),
+    ("soon", None),
+    ("-5", None),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert parse_retry_after(formatdate(time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
+    assert parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_limit_grows_only_when_saturated():
+    controller = make_controller(initial_limit=2, max_limit=8)
+    for _ in range(10): # One request at a time never tests the limit
+        controller.acquire()
+        controller.release(latency=0.01)
+    assert controller.limit == 2
+
+    controller.acquire()
+    controller.acquire()
+    controller.release(latency=0.01) # Both slots were busy
+    assert controller.limit == 2.5
+    controller.release(latency=0.01) # Only one left in flight
+    assert controller.limit == 2.5
+
+
+def test_limit_is_capped_at_max_limit():
+    controller = make_controller(initial_limit=1, max_limit=3)
+    for _ in range(20):
+        for _ in range(int(controller.limit)):
+            controller.acquire()
+        for _ in range(int(controller.limit)):
+            controller.release(latency=0.01)
+    assert controller.limit == 3
+
+
+def test_errors_halve_the_limit():
+    controller = make_controller(initial_limit=8, max_limit=8, error_threshold=0.25, smoothing=0.5)
+    controller.acquire()
+    controller.release(error=True)
+    assert controller.limit == 4
+    assert controller.error_rate == 0.5
+
+
+def test_decrease_respects_cooldown():
+    controller = make_controller(initial_limit=8, max_limit=8, smoothing=1.0, cooldown=60.0)
+    for _ in range(3):
+        controller.acquire()
+        controller.release(error=True)
+    assert controller.limit == 4
+
+
+def test_rising_latency_halves_the_limit_and_relearns_baseline():
+    controller = make_controller(initial_limit=8, max_limit=8, smoothing=1.0,
+                                 latency_tolerance=2.0, latency_floor=0.05)
+    controller.acquire()
+    controller.release(latency=0.1)
+    controller.acquire()
+    controller.release(latency=0.15) # Within tolerance
+    assert controller.limit == 8
+    controller.acquire()
+    controller.release(latency=0.5)
+    assert controller.limit == 4
+    assert controller.baseline_latency == 0.5
+
+
+def test_jitter_below_latency_floor_is_not_congestion():
+    controller = make_controller(initial_limit=4, max_limit=4, smoothing=1.0, latency_floor=0.05)
+    controller.acquire()
+    controller.release(latency=0.001)
+    controller.acquire()
+    controller.release(latency=0.04) # 40x the baseline, but still below the floor
+    assert controller.limit == 4
+
+
+def test_throttle_halves_limit_and_pauses():
+    controller = make_controller(initial_limit=4, max_limit=4, default_throttle_pause=5.0, max_pause=10.0)
+    controller.acquire()
+    controller.release(throttled=True)
+    assert controller.limit == 2
+    assert controller.throttle_count == 1
+    assert controller.pause_remaining() == pytest.approx(5.0, abs=0.5)
+
+    with pytest.raises(ThrottledError) as info:
+        controller.acquire(max_wait=1.0)
+    assert info.value.retry_in == pytest.approx(5.0, abs=0.5)
+
+
+def test_retry_after_is_capped_at_max_pause():
+    controller = make_controller(max_pause=3.0)
+    controller.acquire()
+    controller.release(throttled=True, retry_after=3600)
+    assert controller.pause_remaining() <= 3.0
+    assert controller.metrics()["paused_for_s"] == pytest.approx(3.0, abs=0.5)
+
+
+def test_acquire_waits_out_the_pause():
+    controller = make_controller(default_throttle_pause=0.2)
+    controller.acquire()
+    controller.release(throttled=True)
+    started = time.monotonic()
+    controller.acquire(max_wait=1.0)
+    assert time.monotonic() - started >= 0.15
+    controller.release(latency=0.01)
+
+
+def test_acquire_blocks_until_a_slot_is_released():
+    controller = make_controller(initial_limit=1, max_limit=1)
+    controller.acquire()
+    timer = threading.Timer(0.2, controller.release, kwargs={"latency": 0.01})
+    timer.start()
+    started = time.monotonic()
+    controller.acquire()
+    assert time.monotonic() - started >= 0.15
+    controller.release(latency=0.01)
+    timer.join()
+
+
+def test_acquire_can_be_cancelled():
+    controller = make_controller(initial_limit=1, max_limit=1)
+    controller.acquire()
+    with pytest.raises(InterruptedError):
+        controller.acquire(should_continue=lambda: False)
+    assert controller.in_flight == 1
+
+
+def test_slot_classifies_outcomes():
+    controller = make_controller(initial_limit=4, max_limit=4, smoothing=1.0, max_pause=0.5,
+                                 throttle_exceptions=(BotCheck,), ignored_exceptions=(BadUrl,))
+    with pytest.raises(BadUrl):
+        with controller.slot():
+            raise BadUrl()
+    assert controller.limit == 4 and controller.error_rate == 0.0 # Neutral
+
+    with pytest.raises(InterruptedError):
+        with controller.slot():
+            raise InterruptedError()
+    assert controller.limit == 4 and controller.error_rate == 0.0
+
+    with pytest.raises(HTTPError):
+        with controller.slot():
+            raise http_error(429, retry_after="3600")
+    assert controller.limit == 2 and controller.throttle_count == 1
+    assert controller.pause_remaining() <= 0.5
+
+    time.sleep(controller.pause_remaining())
+    with pytest.raises(BotCheck):
+        with controller.slot():
+            raise BotCheck()
+    assert controller.limit == 1 and controller.throttle_count == 2
+
+    time.sleep(controller.pause_remaining())
+    with pytest.raises(HTTPError):
+        with controller.slot():
+            raise http_error(500)
+    assert controller.error_rate == 1.0 and controller.throttle_count == 2
+    assert controller.in_flight == 0
+
+
+def test_slot_records_marked_latency():
+    controller = make_controller()
+    with controller.slot() as mark_latency:
+        mark_latency()
+        time.sleep(0.1) # Body transfer after the first byte
+    assert controller.latency < 0.05
+
+
+def test_metrics_and_format_metrics():
+    controller = AdaptiveConcurrencyController("test metrics", initial_limit=3)
+    assert concurrency.all_metrics()["test metrics"] == {
+        "limit": 3, "in_flight": 0, "latency_ms": None, "baseline_latency_ms": None,
+        "error_rate": 0.0, "paused_for_s": 0.0, "throttle_count": 0,
+    }
+    with controller.slot():
+        pass
+    assert ("[concurrency] test metrics: limit 3, in flight 0, latency 0 ms, "
+            "error rate 0%, throttled 0x, paused 0s") in concurrency.format_metrics().splitlines()
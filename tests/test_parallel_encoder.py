@@ -0,0 +1,148 @@
+import io
+import os
+import math
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+pytest.importorskip("moviepy")
+
+from ytdownloader.core import parallel_encoder as pe
+
+
+def make_header(bitrate_index=9, rate_index=0, padding=0):
+    """MPEG-1 Layer III, no CRC, joint stereo (128 kbps / 44.1 kHz by default)."""
+    return bytes([0xFF, 0xFB, (bitrate_index << 4) | (rate_index << 2) | (padding << 1), 0x64])
+
+
+def make_frame(**kwargs):
+    header = make_header(**kwargs)
+    return header + bytes(pe._frame_length(header) - 4)
+
+
+@pytest.mark.parametrize("bitrate_index, rate_index, padding, expected", [
+    (9, 0, 0, 417),  # 128 kbps, 44.1 kHz
+    (9, 0, 1, 418),  # same with the padding bit
+    (10, 1, 0, 480), # 160 kbps, 48 kHz
+    (14, 2, 0, 1440), # 320 kbps, 32 kHz
+])
+def test_frame_length(bitrate_index, rate_index, padding, expected):
+    assert pe._frame_length(make_header(bitrate_index, rate_index, padding)) == expected
+
+
+@pytest.mark.parametrize("header", [
+    b"\x00\xFB\x90\x64",  # no sync
+    b"\xFF\xFD\x90\x64",  # Layer II
+    b"\xFF\xF3\x90\x64",  # MPEG-2
+    b"\xFF\xFB\xF0\x64",  # bad bitrate index
+    b"\xFF\xFB\x0C\x64",  # reserved sample rate
+    b"\xFF\xFB",          # truncated
+])
+def test_frame_length_rejects_invalid_headers(header):
+    assert pe._frame_length(header) is None
+
+
+def test_split_frames():
+    frames = [make_frame(), make_frame(padding=1), make_frame(bitrate_index=10)]
+    data = b"".join(frames)
+    assert pe._split_frames(io.BytesIO(data)) == [(0, 417), (417, 418), (835, 522)]
+    with pytest.raises(pe.ChunkedEncodeError):
+        pe._split_frames(io.BytesIO(data + b"junk"))
+    with pytest.raises(pe.ChunkedEncodeError):
+        pe._split_frames(io.BytesIO(data[:-1])) # Last frame cut short
+
+
+@pytest.mark.parametrize("start, length", [(0, 10), (417, 418), (100, 3 * 1024 + 5)])
+def test_copy_range(monkeypatch, start, length):
+    monkeypatch.setattr(pe, "COPY_BUFFER_SIZE", 1024)
+    data = bytes(range(256)) * 20
+    dst = io.BytesIO()
+    pe._copy_range(io.BytesIO(data), dst, start, length)
+    assert dst.getvalue() == data[start:start + length]
+    with pytest.raises(pe.ChunkedEncodeError):
+        pe._copy_range(io.BytesIO(data), io.BytesIO(), len(data) - 5, 10)
+
+
+@pytest.mark.parametrize("total_samples, chunk_count", [(44100 * 600, 4), (1234567, 3), (10 ** 8 + 7, 16)])
+def test_plan_chunks_is_contiguous_and_covers_everything(total_samples, chunk_count):
+    plan = pe._plan_chunks(total_samples, chunk_count)
+    assert len(plan) == chunk_count
+    assert plan[0][0] == 0
+    assert plan[-1][1] is None
+    for (first, count), (next_first, _) in zip(plan, plan[1:]):
+        assert count > 0
+        assert first + count == next_first
+    # The last chunk still has audio in it once the encoder delay is accounted for
+    last_boundary = plan[-1][0] * pe.SAMPLES_PER_FRAME - pe.START_PADDING
+    assert 0 < last_boundary < total_samples
+
+
+def test_pre_roll_lands_on_frame_boundary():
+    assert pe.PRE_ROLL_SAMPLES > 0
+    assert (pe.PRE_ROLL_SAMPLES + pe.START_PADDING) % pe.SAMPLES_PER_FRAME == 0
+
+
+def test_crc16_matches_crc16_arc():
+    assert pe._crc16(b"123456789") == 0xBB3D
+
+
+@pytest.mark.parametrize("bitrate_kbps, rate_index", [(128, 0), (32, 1), (320, 2)])
+def test_info_frame_layout(bitrate_kbps, rate_index):
+    audio_frames, audio_bytes, padding = 12345, 6789012, 1234
+    first_header = make_header(rate_index=rate_index)
+    frame = pe._build_info_frame(first_header, audio_frames, audio_bytes, padding, bitrate_kbps)
+
+    # A valid frame of the same sample rate, big enough for the tag
+    assert pe._frame_length(frame[:4]) == len(frame)
+    assert len(frame) >= pe.INFO_TAG_MIN_FRAME
+    assert (frame[2] >> 2) & 0x3 == rate_index
+    assert frame[3] == first_header[3]
+
+    tag = 36
+    assert frame[tag:tag + 4] == b"Info"
+    flags, frames, total_bytes = struct.unpack(">III", frame[tag + 4:tag + 16])
+    assert flags == 0x0F
+    assert frames == audio_frames
+    assert total_bytes == len(frame) + audio_bytes
+    assert list(frame[tag + 16:tag + 116]) == sorted(frame[tag + 16:tag + 116])
+
+    lame = tag + 120
+    assert frame[lame:lame + 9] == b"LAME3.100"
+    delay_padding = int.from_bytes(frame[lame + 21:lame + 24], "big")
+    assert delay_padding >> 12 == pe.LAME_ENCODER_DELAY
+    assert delay_padding & 0xFFF == padding
+    assert struct.unpack(">I", frame[lame + 28:lame + 32])[0] == total_bytes
+    assert struct.unpack(">H", frame[lame + 34:lame + 36])[0] == pe._crc16(frame[:190])
+
+
+@pytest.mark.skipif(not os.path.exists(pe.FFMPEG_BINARY) and not shutil.which(pe.FFMPEG_BINARY),
+                    reason="ffmpeg not available")
+@pytest.mark.parametrize("codec, extension, rate", [("aac", "m4a", 44100), ("libopus", "webm", 48000)])
+def test_chunked_output_is_sample_exact(tmp_path, monkeypatch, codec, extension, rate):
+    monkeypatch.setattr(pe, "MIN_CHUNK_SECONDS", 2)
+    source = str(tmp_path / f"source.{extension}")
+    subprocess.run([pe.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:duration=10:sample_rate={rate}",
+                    "-ac", "2", "-c:a", codec, source], check=True)
+    output = str(tmp_path / "out.mp3")
+
+    pe.encode_mp3_parallel(source, output, bitrate="128k", workers=4)
+
+    expected = pe.decoded_sample_count(source, rate)
+    assert pe.decoded_sample_count(output, rate) == expected
+    assert pe.ffmpeg_parse_infos(output)["duration"] == pytest.approx(expected / rate, abs=0.1) # Header duration includes delay/padding
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".ytdownloader_mp3_")]
+
+    # Same audio as a single-pass encode right across every chunk boundary
+    seams = pe.planned_seams(expected, rate, 4)
+    assert len(seams) == 3
+    reference = pe.encode_reference_mp3(source, str(tmp_path / "reference.mp3"), "128k", rate)
+    assert min(pe.seam_snr(reference, output, seams, rate)) > 50
+    # ...and the check would catch a seam that is off by a single sample
+    expected_windows = pe._decoded_windows(reference, rate, [(seam - 1152, seam + 1152) for seam in seams])
+    shifted_windows = pe._decoded_windows(output, rate, [(seam - 1151, seam + 1153) for seam in seams])
+    for ref, enc in zip(expected_windows, shifted_windows):
+        error = sum((x - y) ** 2 for x, y in zip(ref, enc))
+        assert 10 * math.log10(sum(x * x for x in ref) / error) < 30
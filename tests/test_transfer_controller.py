@@ -0,0 +1,264 @@
+import socket
+import time
+import urllib.request
+from types import SimpleNamespace
+from urllib.error import HTTPError
+
+import pytest
+
+pytube_request = pytest.importorskip("pytubefix.request")
+
+from ytdownloader.core import transfer_controller as tc
+from ytdownloader.core.concurrency import AdaptiveConcurrencyController
+
+MIB = 1024 * 1024
+
+
+class FakeResponse:
+    """Serves a range body; optionally stops early or sleeps before every read."""
+
+    def __init__(self, body, truncate_at=None, read_delay=0.0):
+        self.body = body if truncate_at is None else body[:truncate_at]
+        self.read_delay = read_delay
+        self.position = 0
+
+    def read(self, size):
+        if self.read_delay:
+            time.sleep(self.read_delay)
+        chunk = self.body[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeServer:
+    """
+    Stands in for urlopen. Each request pops the next scripted behaviour:
+    None serves the range, a dict is passed to FakeResponse, an exception is raised.
+    Once the script runs out every request is served normally.
+    """
+
+    def __init__(self, data, script=()):
+        self.data = data
+        self.script = list(script)
+        self.ranges = []
+
+    def urlopen(self, request, timeout=None):
+        start, end = (int(part) for part in request.full_url.rsplit("&range=", 1)[1].split("-"))
+        self.ranges.append((start, end))
+        behaviour = self.script.pop(0) if self.script else None
+        if isinstance(behaviour, BaseException):
+            raise behaviour
+        return FakeResponse(self.data[start:end + 1], **(behaviour or {}))
+
+
+def http_error(code, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return HTTPError("https://example.invalid/video", code, "error", headers, None)
+
+
+def make_stream(data, **attributes):
+    return SimpleNamespace(url="https://example.invalid/video?itag=140", filesize=len(data), **attributes)
+
+
+@pytest.fixture
+def data():
+    return bytes(range(256)) * (3 * MIB // 256 + 7)
+
+
+@pytest.fixture
+def limiter():
+    return AdaptiveConcurrencyController("test stream", initial_limit=2, max_limit=4,
+                                         default_throttle_pause=0.3, max_pause=0.5)
+
+
+def fast_controller(**kwargs):
+    kwargs.setdefault("initial_chunk_size", MIB)
+    kwargs.setdefault("min_chunk_size", 256 * 1024)
+    kwargs.setdefault("base_backoff", 0.01)
+    kwargs.setdefault("max_backoff", 0.05)
+    return tc.TransferController(**kwargs)
+
+
+def run_download(tmp_path, monkeypatch, data, server, limiter, controller=None, stream=None):
+    monkeypatch.setattr(urllib.request, "urlopen", server.urlopen)
+    statuses = []
+    path = tc.download_stream(stream or make_stream(data), str(tmp_path), "out.bin",
+                              controller=controller or fast_controller(),
+                              on_status=statuses.append, limiter=limiter)
+    with open(path, "rb") as fh:
+        assert fh.read() == data
+    return statuses
+
+
+def test_first_sample_sets_average_and_chunk_moves_at_most_two_fold():
+    controller = tc.TransferController(initial_chunk_size=MIB, min_chunk_size=256 * 1024,
+                                       max_chunk_size=8 * MIB, target_chunk_seconds=4.0)
+    controller.record(10 * MIB, 1.0) # Wants 40 MiB per request
+    assert controller.average_throughput == 10 * MIB
+    assert controller.chunk_size == 2 * MIB
+    for _ in range(5):
+        controller.record(10 * MIB, 1.0)
+    assert controller.chunk_size == 8 * MIB # Capped at max_chunk_size
+
+    controller.average_throughput = 1024 # Link collapsed
+    for _ in range(10):
+        controller.record(1024, 1.0)
+    assert controller.chunk_size == 256 * 1024 # Shrinks step by step to min_chunk_size
+
+
+def test_chunk_size_never_exceeds_pytubefix_range_size():
+    controller = tc.TransferController()
+    for _ in range(20):
+        controller.record(100 * MIB, 1.0)
+    assert controller.chunk_size == pytube_request.default_range_size
+
+
+def test_record_ignores_empty_samples():
+    controller = tc.TransferController()
+    controller.record(0, 1.0)
+    controller.record(1024, 0)
+    assert controller.average_throughput is None
+    assert controller.chunk_size == 1024 * 1024
+
+
+def test_next_range_is_inclusive_and_clipped():
+    controller = tc.TransferController(initial_chunk_size=1000)
+    assert controller.next_range(0, 5000) == (0, 999)
+    assert controller.next_range(4500, 5000) == (4500, 4999)
+
+
+def test_check_progress():
+    controller = tc.TransferController(slow_ratio=0.2, min_sample_seconds=3.0)
+    controller.check_progress(1, 10.0) # No average yet: nothing to compare against
+    controller.average_throughput = 1000.0
+    controller.check_progress(1, 2.9) # Too early to judge
+    controller.check_progress(600, 3.0) # 200 B/s is exactly the threshold
+    with pytest.raises(tc.StallDetectedError):
+        controller.check_progress(500, 3.0)
+
+
+def test_on_stall_halves_down_to_minimum():
+    controller = tc.TransferController(initial_chunk_size=MIB, min_chunk_size=400 * 1024)
+    controller.on_stall()
+    assert controller.chunk_size == MIB // 2
+    controller.on_stall()
+    assert controller.chunk_size == 400 * 1024
+
+
+def test_backoff_delay_is_exponential_and_capped():
+    controller = tc.TransferController(base_backoff=1.0, max_backoff=30.0)
+    assert [controller.backoff_delay(attempt) for attempt in range(1, 7)] == [1, 2, 4, 8, 16, 30]
+
+
+@pytest.mark.parametrize("attributes, expected", [
+    ({}, True),
+    ({"is_sabr": True}, False),
+    ({"is_otf": True}, False),
+    ({"filesize": 0}, False),
+    ({"filesize": None}, False),
+])
+def test_supports_range_download(attributes, expected):
+    stream = SimpleNamespace(url="https://example.invalid", filesize=1024)
+    for name, value in attributes.items():
+        setattr(stream, name, value)
+    assert tc.supports_range_download(stream) is expected
+
+
+def test_download_stream_rejects_unknown_size(tmp_path, limiter):
+    stream = SimpleNamespace(url="https://example.invalid", filesize=0)
+    with pytest.raises(ValueError):
+        tc.download_stream(stream, str(tmp_path), "out.bin", limiter=limiter)
+
+
+def test_download_in_ranges(tmp_path, monkeypatch, data, limiter):
+    server = FakeServer(data)
+    assert run_download(tmp_path, monkeypatch, data, server, limiter) == []
+    assert server.ranges[0] == (0, MIB - 1)
+    for (_, end), (next_start, _) in zip(server.ranges, server.ranges[1:]):
+        assert next_start == end + 1
+    assert server.ranges[-1][1] == len(data) - 1
+
+
+def test_resumes_from_offset_after_truncated_response(tmp_path, monkeypatch, data, limiter):
+    server = FakeServer(data, script=[{"truncate_at": 300000}])
+    statuses = run_download(tmp_path, monkeypatch, data, server, limiter)
+    assert server.ranges[1][0] == 300000
+    assert len(statuses) == 1 and "Retrying from 0.3 MiB" in statuses[0]
+
+
+def test_resumes_after_socket_timeout(tmp_path, monkeypatch, data, limiter):
+    server = FakeServer(data, script=[None, socket.timeout("timed out")])
+    controller = fast_controller()
+    statuses = run_download(tmp_path, monkeypatch, data, server, limiter, controller)
+    assert server.ranges[2][0] == server.ranges[1][0] # Same range reissued
+    assert server.ranges[2][1] < server.ranges[1][1] # ...with a smaller chunk
+    assert len(statuses) == 1
+
+
+def test_slow_throughput_is_detected_as_stall(tmp_path, monkeypatch, data, limiter):
+    controller = fast_controller(min_sample_seconds=0.1)
+    controller.average_throughput = 10 * MIB # 64 KiB per 50 ms is ~1.3 MiB/s, well below 20%
+    server = FakeServer(data, script=[{"read_delay": 0.05}])
+    statuses = run_download(tmp_path, monkeypatch, data, server, limiter, controller)
+    assert len(statuses) == 1 and "Throughput" in statuses[0]
+    assert 0 < server.ranges[1][0] < MIB
+
+
+def test_429_honours_retry_after_capped_at_max_pause(tmp_path, monkeypatch, data, limiter):
+    server = FakeServer(data, script=[http_error(429, retry_after="3600")])
+    started = time.monotonic()
+    statuses = run_download(tmp_path, monkeypatch, data, server, limiter)
+    assert time.monotonic() - started < 2.0
+    assert len(statuses) == 1 and "429" in statuses[0]
+    assert limiter.throttle_count == 1
+    assert server.ranges[1][0] == 0
+
+
+def test_503_retry_after_is_capped_at_max_pause(tmp_path, monkeypatch, data, limiter):
+    server = FakeServer(data, script=[http_error(503, retry_after="3600")])
+    started = time.monotonic()
+    run_download(tmp_path, monkeypatch, data, server, limiter)
+    assert time.monotonic() - started < 2.0
+    assert limiter.throttle_count == 0 # 503 is an error for the limiter, not a throttle
+
+
+def test_throttle_pause_is_not_mistaken_for_a_stall(tmp_path, monkeypatch, data, limiter):
+    # 429 without Retry-After: the limiter pauses 0.3s while the backoff is only 10 ms.
+    # The wait for the slot must not count against the next request's throughput.
+    controller = fast_controller(min_sample_seconds=0.1)
+    controller.average_throughput = 10 * MIB
+    server = FakeServer(data, script=[http_error(429)])
+    started = time.monotonic()
+    statuses = run_download(tmp_path, monkeypatch, data, server, limiter, controller)
+    assert time.monotonic() - started >= 0.3
+    assert len(statuses) == 1 and "429" in statuses[0]
+
+
+def test_gives_up_after_max_retries(tmp_path, monkeypatch, data, limiter):
+    monkeypatch.setattr(urllib.request, "urlopen",
+                        FakeServer(data, script=[socket.timeout("timed out")] * 3).urlopen)
+    with pytest.raises(tc.StallDetectedError, match="Giving up after 2 retries"):
+        tc.download_stream(make_stream(data), str(tmp_path), "out.bin",
+                           controller=fast_controller(max_retries=2), limiter=limiter)
+
+
+def test_non_retryable_http_error_is_raised(tmp_path, monkeypatch, data, limiter):
+    monkeypatch.setattr(urllib.request, "urlopen", FakeServer(data, script=[http_error(404)]).urlopen)
+    with pytest.raises(HTTPError) as info:
+        tc.download_stream(make_stream(data), str(tmp_path), "out.bin",
+                           controller=fast_controller(), limiter=limiter)
+    assert info.value.code == 404
+
+
+def test_cancel_raises_interrupted(tmp_path, monkeypatch, data, limiter):
+    monkeypatch.setattr(urllib.request, "urlopen", FakeServer(data).urlopen)
+    with pytest.raises(InterruptedError):
+        tc.download_stream(make_stream(data), str(tmp_path), "out.bin",
+                           controller=fast_controller(), should_continue=lambda: False, limiter=limiter)
+    assert limiter.in_flight == 0
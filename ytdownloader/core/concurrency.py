@@ -0,0 +1,228 @@
+# YTDownloaderPro/ytdownloader/core/concurrency.py
+import time
+import threading
+import contextlib
+from email.utils import parsedate_to_datetime
+from urllib.error import HTTPError
+
+from ..utils.tracing import get_tracer
+
+THROTTLE_STATUS_CODES = (429, 403) # YouTube answers throttled clients with either
+
+
+
+class ThrottledError(Exception):
+    """Raised by acquire() when a throttle pause would outlast the caller's max_wait."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"'{name}' requests are throttled; retry in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header (delta-seconds or HTTP-date).
+
+    Returns:
+        float or None: Seconds to wait, or None if the header is missing/invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD limiter for requests to one remote endpoint. Each healthy response
+    that completes while every slot was in use grows the limit by 1/limit
+    (about +1 per saturated round of requests); a throttle
+    response, a rising error rate or latency well above the best seen so far
+    halves it, at most once per cooldown. Retry-After pauses new requests.
+    """
+
+    def __init__(self, name, initial_limit=2, min_limit=1, max_limit=8,
+                 decrease_factor=0.5, latency_tolerance=2.0, error_threshold=0.25,
+                 latency_floor=0.05, smoothing=0.2, cooldown=2.0, default_throttle_pause=5.0,
+                 max_pause=120.0,
+                 throttle_exceptions=(), ignored_exceptions=()):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance # Multiple of baseline latency treated as congestion
+        self.latency_floor = latency_floor # Jitter below this many seconds is never congestion
+        self.error_threshold = error_threshold # Smoothed error rate that triggers a decrease
+        self.smoothing = smoothing
+        self.cooldown = cooldown # Min seconds between two decreases
+        self.default_throttle_pause = default_throttle_pause # Used when Retry-After is absent
+        self.max_pause = max_pause # Cap on any pause, whatever Retry-After asks for
+        self.throttle_exceptions = throttle_exceptions
+        self.ignored_exceptions = ignored_exceptions # Caller errors that say nothing about the server
+
+        self.in_flight = 0
+        self.latency = None # Smoothed latency in seconds
+        self.baseline_latency = None # Best smoothed latency seen
+        self.error_rate = 0.0
+        self.paused_until = 0.0
+        self.throttle_count = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        with _controllers_lock:
+            _controllers[name] = self
+
+    def acquire(self, should_continue=None, max_wait=None):
+        """
+        Blocks until a slot is free and no Retry-After pause is active. Raises
+        ThrottledError instead if the pause would last longer than max_wait seconds.
+        """
+        with self._cond:
+            while True:
+                if should_continue and not should_continue():
+                    raise InterruptedError("Cancelled while waiting for a request slot.")
+                wait = self.paused_until - time.monotonic()
+                if max_wait is not None and wait > max_wait:
+                    raise ThrottledError(self.name, wait)
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    self._report()
+                    return
+                self._cond.wait(timeout=min(0.1, wait) if wait > 0 else 0.1)
+
+    def release(self, latency=None, error=False, throttled=False, retry_after=None, neutral=False):
+        """
+        Frees a slot and feeds the outcome of the request into the controller.
+        A neutral release (cancelled, or a caller error) leaves the limit untouched.
+        """
+        with self._cond:
+            # Only a limit that was actually hit has been tested against the server
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if neutral:
+                pass
+            elif throttled:
+                self.throttle_count += 1
+                pause = retry_after if retry_after is not None else self.default_throttle_pause
+                pause = min(pause, self.max_pause)
+                self.paused_until = max(self.paused_until, now + pause)
+                self._decrease(now, force=True)
+            else:
+                self.error_rate += self.smoothing * ((1.0 if error else 0.0) - self.error_rate)
+                if latency is not None and not error:
+                    self._observe_latency(latency)
+                if self.error_rate > self.error_threshold or self._latency_rising():
+                    self._decrease(now)
+                elif not error and saturated:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._report()
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+        if self.baseline_latency is None or self.latency < self.baseline_latency:
+            self.baseline_latency = self.latency
+
+    def _latency_rising(self):
+        return (self.baseline_latency is not None and
+                self.latency > max(self.baseline_latency, self.latency_floor) * self.latency_tolerance)
+
+    def _decrease(self, now, force=False):
+        if not force and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        if self._latency_rising():
+            # Re-learn the baseline so one slow period doesn't pin the limit down forever
+            self.baseline_latency = self.latency
+
+    @contextlib.contextmanager
+    def slot(self, should_continue=None, max_wait=None):
+        """
+        Holds a request slot for the duration of the block and classifies how it
+        ended. Call the yielded function to record latency early, e.g. at the
+        first byte of a long transfer; otherwise the whole block is timed.
+        should_continue and max_wait are passed on to acquire().
+        """
+        self.acquire(should_continue, max_wait)
+        start = time.monotonic()
+        marked = []
+
+        def mark_latency():
+            if not marked:
+                marked.append(time.monotonic() - start)
+
+        try:
+            yield mark_latency
+        except HTTPError as e:
+            if e.code in THROTTLE_STATUS_CODES:
+                self.release(throttled=True, retry_after=parse_retry_after(e.headers.get("Retry-After")))
+            else:
+                self.release(error=True)
+            raise
+        except self.throttle_exceptions:
+            self.release(throttled=True)
+            raise
+        except (InterruptedError,) + tuple(self.ignored_exceptions):
+            self.release(neutral=True)
+            raise
+        except BaseException:
+            self.release(error=True)
+            raise
+        else:
+            self.release(latency=marked[0] if marked else time.monotonic() - start)
+
+    def pause_remaining(self):
+        """Seconds left of the current Retry-After pause, 0 if none."""
+        with self._cond:
+            return max(0.0, self.paused_until - time.monotonic())
+
+    def metrics(self):
+        """Returns a snapshot of the controller state."""
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "baseline_latency_ms": (round(self.baseline_latency * 1000, 1)
+                                        if self.baseline_latency is not None else None),
+                "error_rate": round(self.error_rate, 3),
+                "paused_for_s": round(self.pause_remaining(), 1),
+                "throttle_count": self.throttle_count,
+            }
+
+    def _report(self):
+        # Shows up as a counter track in the trace when tracing is enabled
+        get_tracer().counter(f"concurrency: {self.name}", limit=int(self.limit),
+                             in_flight=self.in_flight)
+
+
+def all_metrics():
+    """Returns metrics() of every controller, keyed by controller name."""
+    with _controllers_lock:
+        controllers = dict(_controllers)
+    return {name: controller.metrics() for name, controller in controllers.items()}
+
+
+def format_metrics():
+    """One line per controller with its limit and throttle state, for logs."""
+    lines = []
+    for name, m in sorted(all_metrics().items()):
+        latency = f"{m['latency_ms']:.0f} ms" if m["latency_ms"] is not None else "n/a"
+        lines.append(f"[concurrency] {name}: limit {m['limit']}, in flight {m['in_flight']}, "
+                     f"latency {latency}, error rate {m['error_rate']:.0%}, "
+                     f"throttled {m['throttle_count']}x, paused {m['paused_for_s']:.0f}s")
+    return "\n".join(lines)
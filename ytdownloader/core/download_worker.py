@@ -2,10 +2,15 @@
 import os
 import time # For small delay
 import re   # For extracting bitrate
+from urllib.error import HTTPError
 from PyQt6.QtCore import QThread, pyqtSignal
 from pytubefix import YouTube # For type hinting the pytube_object
 from pytubefix.streams import Stream # For type hinting
 from moviepy import AudioFileClip # For MP3 conversion
+from .transfer_controller import TransferController, download_stream, supports_range_download, stream_limiter
+from .parallel_encoder import encode_mp3_parallel, should_encode_in_parallel, ChunkedEncodeError
+from .concurrency import format_metrics
+from ..utils.tracing import span, profile_job
 
 
 class InfoFetcherThread(QThread):
@@ -23,7 +28,8 @@ class InfoFetcherThread(QThread):
             # Import get_video_info here to avoid circular dependency if download_worker
             # is imported by youtube_handler for some reason (it shouldn't be)
             from .youtube_handler import get_video_info
-            video_data = get_video_info(self.url)
+            with span("get_video_info", url=self.url):
+                video_data = get_video_info(self.url, should_continue=lambda: self._is_running)
             if not self._is_running: return # Check again after potentially long operation
 
             if video_data.get("success"):
@@ -58,10 +64,18 @@ class DownloadWorkerThread(QThread):
         if not self._is_running:
             return
 
+        # Set YTDOWNLOADER_PROFILE_JOB to attach cProfile/tracemalloc to a job
+        with profile_job(self.filename_base), \
+             span("download job", job=self.filename_base, format=self.output_format):
+            self._run_job()
+        print(format_metrics()) # Where the adaptive limits settled after this job
+
+    def _run_job(self):
         downloaded_filepath_intermediate = None # To store path for potential cleanup
 
         try:
-            stream_to_download: Stream = self.pytube_object.streams.get_by_itag(self.selected_itag)
+            with span("get_by_itag", itag=self.selected_itag):
+                stream_to_download: Stream = self.pytube_object.streams.get_by_itag(self.selected_itag)
             if not stream_to_download:
                 self.error_occurred.emit(f"Could not find stream with itag {self.selected_itag}.")
                 return
@@ -83,20 +97,19 @@ class DownloadWorkerThread(QThread):
                 else:
                     self.progress_updated.emit(0)
 
-            self.pytube_object.register_on_progress_callback(progress_function)
-
             self.status_updated.emit(f"Downloading {self.filename_base} (as {stream_to_download.subtype})...")
 
             # Construct the full intermediate filename pytubefix expects
             intermediate_filename_with_ext = f"{self.filename_base}.{stream_to_download.subtype}"
 
-            downloaded_filepath_intermediate = stream_to_download.download(
-                output_path=self.download_path,
-                filename=intermediate_filename_with_ext
-            )
+            downloaded_filepath_intermediate = os.path.join(self.download_path, intermediate_filename_with_ext)
+
+            with span("network transfer", bytes=stream_to_download.filesize):
+                downloaded_filepath_intermediate = self._download(
+                    stream_to_download, intermediate_filename_with_ext, progress_function
+                )
 
             self.progress_updated.emit(100)
-            self.pytube_object.register_on_progress_callback(None)
 
             if not self._is_running:
                 self.status_updated.emit("Download process stopped post-download.")
@@ -119,7 +132,8 @@ class DownloadWorkerThread(QThread):
                 mp3_filename_base = self.filename_base
                 final_filepath = os.path.join(self.download_path, f"{mp3_filename_base}.mp3")
 
-                time.sleep(0.1) # Small delay, sometimes helps with file locks
+                with span("file lock delay"):
+                    time.sleep(0.1) # Small delay, sometimes helps with file locks
 
                 target_bitrate = None
                 if stream_to_download.abr: # e.g., "160kbps"
@@ -136,14 +150,20 @@ class DownloadWorkerThread(QThread):
                 else:
                     self.status_updated.emit("Warning: Source bitrate not available. Using default for MP3.")
 
-                audio_clip = AudioFileClip(downloaded_filepath_intermediate)
+                with span("AudioFileClip setup"):
+                    audio_clip = AudioFileClip(downloaded_filepath_intermediate)
 
                 try:
-                    if target_bitrate:
-                        audio_clip.write_audiofile(final_filepath, bitrate=target_bitrate, logger=None)
-                    else:
-                        # Fallback to moviepy's default if no bitrate determined (often ~128k)
-                        audio_clip.write_audiofile(final_filepath, logger=None)
+                    encoded = False
+                    if should_encode_in_parallel(audio_clip.duration):
+                        encoded = self._encode_mp3_chunked(downloaded_filepath_intermediate, final_filepath, target_bitrate)
+                    if not encoded:
+                        with span("write_audiofile", bitrate=target_bitrate or "default"):
+                            if target_bitrate:
+                                audio_clip.write_audiofile(final_filepath, bitrate=target_bitrate, logger=None)
+                            else:
+                                # Fallback to moviepy's default if no bitrate determined (often ~128k)
+                                audio_clip.write_audiofile(final_filepath, logger=None)
                 finally: # Ensure clip is closed even if write_audiofile fails
                     audio_clip.close()
 
@@ -172,9 +192,57 @@ class DownloadWorkerThread(QThread):
                     os.remove(downloaded_filepath_intermediate)
                 except Exception as cleanup_e:
                     print(f"Error cleaning up intermediate file: {cleanup_e}")
+
+    def _download(self, stream, filename, progress_function):
+        """
+        Downloads plain ranged streams with our own range-request loop, so a throttled
+        or stalled connection is detected and resumed rather than hanging forever.
+        SABR and OTF streams, and ranged URLs that answer 404, go through
+        pytubefix's stream.download(), which knows how to fetch them.
+        """
+        should_continue = lambda: self._is_running and not self._download_cancelled_flag
+        if supports_range_download(stream):
+            try:
+                return download_stream(
+                    stream,
+                    self.download_path,
+                    filename,
+                    controller=TransferController(),
+                    on_progress=progress_function,
+                    should_continue=should_continue,
+                    on_status=self.status_updated.emit
+                )
+            except HTTPError as e:
+                if e.code != 404:
+                    raise
+                self.status_updated.emit("Range request not found (404). Retrying with sequential download...")
+                self.progress_updated.emit(0)
+
+        self.pytube_object.register_on_progress_callback(progress_function)
+        try:
+            # Counts against the same limit as range requests, so throttling pauses it too
+            with stream_limiter.slot(should_continue):
+                return stream.download(output_path=self.download_path, filename=filename)
         finally:
-            if self.pytube_object:
-                 self.pytube_object.register_on_progress_callback(None)
+            self.pytube_object.register_on_progress_callback(None)
+
+    def _encode_mp3_chunked(self, source_path, mp3_path, target_bitrate):
+        """Encodes long audio across all cores. Returns False if the caller should fall back to single-pass."""
+        self.status_updated.emit(f"Long audio: converting to MP3 in parallel on {os.cpu_count()} cores...")
+        try:
+            with span("parallel mp3 encode", bitrate=target_bitrate or "default", workers=os.cpu_count()):
+                encode_mp3_parallel(
+                    source_path,
+                    mp3_path,
+                    bitrate=target_bitrate,
+                    on_progress=self.progress_updated.emit,
+                    should_continue=lambda: self._is_running
+                )
+            return True
+        except ChunkedEncodeError as e:
+            self.status_updated.emit(f"Parallel conversion unavailable ({e}). Falling back to single-pass...")
+            self.progress_updated.emit(0)
+            return False
 
     def stop(self):
         self.status_updated.emit("Attempting to stop download/conversion...")
@@ -0,0 +1,201 @@
+# YTDownloaderPro/ytdownloader/core/transfer_controller.py
+import os
+import time
+import socket
+import urllib.request
+from urllib.error import URLError, HTTPError
+from http.client import IncompleteRead
+
+from pytubefix import request as pytube_request
+
+from .concurrency import AdaptiveConcurrencyController, parse_retry_after
+
+# Headers pytubefix sends for its own range requests
+REQUEST_HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+READ_BLOCK_SIZE = 64 * 1024 # Granularity of reads inside one range request
+
+RETRYABLE_STATUS_CODES = (429, 503) # Throttled or overloaded; the URL itself is still good
+
+# Shared by every range request so parallel downloads back off together when throttled
+stream_limiter = AdaptiveConcurrencyController("stream", initial_limit=2, max_limit=16)
+
+
+class StallDetectedError(Exception):
+    """Raised inside a range request when the connection stalls or crawls."""
+
+
+class TransferController:
+    """
+    Tracks throughput of a single connection and decides how big the next
+    range request should be, whether the current one has stalled, and how
+    long to back off before reissuing it.
+    """
+
+    def __init__(self, initial_chunk_size=1024 * 1024, min_chunk_size=256 * 1024,
+                 max_chunk_size=pytube_request.default_range_size, target_chunk_seconds=4.0,
+                 stall_timeout=15.0, slow_ratio=0.2, min_sample_seconds=3.0,
+                 smoothing=0.3, max_retries=6, base_backoff=1.0, max_backoff=30.0):
+        self.chunk_size = initial_chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size # pytubefix's own range size; larger ranges risk being refused
+        self.target_chunk_seconds = target_chunk_seconds
+        self.stall_timeout = stall_timeout # Seconds without a single byte
+        self.slow_ratio = slow_ratio # Fraction of the moving average considered a stall
+        self.min_sample_seconds = min_sample_seconds # Don't judge a request before this
+        self.smoothing = smoothing # EWMA weight of the newest sample
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.average_throughput = None # bytes/second, None until the first sample
+
+    def record(self, num_bytes, elapsed):
+        """Feeds a completed (or aborted) request into the moving average."""
+        if elapsed <= 0 or num_bytes <= 0:
+            return
+        sample = num_bytes / elapsed
+        if self.average_throughput is None:
+            self.average_throughput = sample
+        else:
+            self.average_throughput = (self.smoothing * sample +
+                                       (1 - self.smoothing) * self.average_throughput)
+        self._resize_chunk()
+
+    def _resize_chunk(self):
+        # Aim for requests that take about target_chunk_seconds, but move at most
+        # a factor of two per step so one noisy sample can't swing it wildly
+        wanted = int(self.average_throughput * self.target_chunk_seconds)
+        wanted = max(self.chunk_size // 2, min(wanted, self.chunk_size * 2))
+        self.chunk_size = max(self.min_chunk_size, min(wanted, self.max_chunk_size))
+
+    def next_range(self, offset, total_size):
+        """Returns the inclusive (start, end) byte range of the next request."""
+        return offset, min(offset + self.chunk_size, total_size) - 1
+
+    def check_progress(self, request_bytes, request_elapsed):
+        """
+        Raises StallDetectedError if the running request crawls well below the
+        moving average. Silence for stall_timeout seconds is caught by the socket timeout.
+        """
+        if self.average_throughput is None or request_elapsed < self.min_sample_seconds:
+            return
+        current = request_bytes / request_elapsed
+        if current < self.average_throughput * self.slow_ratio:
+            raise StallDetectedError(
+                f"Throughput {current / 1024:.0f} KiB/s fell below "
+                f"{self.slow_ratio:.0%} of average {self.average_throughput / 1024:.0f} KiB/s")
+
+    def on_stall(self):
+        """Shrinks the chunk size after a stall; the link is evidently slower."""
+        self.chunk_size = max(self.min_chunk_size, self.chunk_size // 2)
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff for the given (1-based) retry attempt."""
+        return min(self.max_backoff, self.base_backoff * (2 ** (attempt - 1)))
+
+
+def supports_range_download(stream):
+    """
+    True if the stream is a plain URL of known size that answers &range= requests.
+    SABR (server-driven) and OTF (sequence) streams need pytubefix's own download,
+    and without a size there is no way to tell when the range loop is done.
+    """
+    if getattr(stream, "is_sabr", False) or getattr(stream, "is_otf", False):
+        return False
+    return (stream.filesize or 0) > 0
+
+
+def download_stream(stream, output_path, filename, controller=None,
+                    on_progress=None, should_continue=None, on_status=None, limiter=None):
+    """
+    Downloads a pytubefix Stream with range requests sized by a TransferController.
+    A stalled or throttled request is reissued from the current offset with
+    exponential backoff (or after Retry-After, when the server sends one).
+    Each range request holds a slot of the limiter (stream_limiter by default).
+
+    on_progress(stream, chunk, bytes_remaining) mirrors pytubefix's progress callback.
+    should_continue() returning False raises InterruptedError.
+
+    Returns:
+        str: Path of the downloaded file.
+    """
+    controller = controller or TransferController()
+    limiter = limiter or stream_limiter
+    should_continue = should_continue or (lambda: True)
+    file_path = os.path.join(output_path, filename)
+    total_size = stream.filesize
+    if not total_size or total_size <= 0:
+        raise ValueError(f"Stream size is unknown ({total_size!r}); cannot download it by range.")
+    offset = 0
+    attempt = 0
+
+    with open(file_path, "wb") as fh:
+        while offset < total_size:
+            if not should_continue():
+                raise InterruptedError("Download cancelled by user.")
+
+            start, end = controller.next_range(offset, total_size)
+            request_start = time.monotonic()
+            request_bytes = 0
+            retry_after = None
+            try:
+                request = urllib.request.Request(f"{stream.url}&range={start}-{end}",
+                                                 headers=REQUEST_HEADERS)
+                with limiter.slot(should_continue) as mark_latency:
+                    # Time spent queued for a slot (or paused by a throttle) is not transfer time
+                    request_start = time.monotonic()
+                    with urllib.request.urlopen(request, timeout=controller.stall_timeout) as response:
+                        mark_latency() # Time to first byte; the body length depends on chunk size
+                        while offset <= end:
+                            if not should_continue():
+                                raise InterruptedError("Download cancelled by user.")
+                            chunk = response.read(min(READ_BLOCK_SIZE, end - offset + 1))
+                            now = time.monotonic()
+                            if not chunk:
+                                break
+                            fh.write(chunk)
+                            offset += len(chunk)
+                            request_bytes += len(chunk)
+                            if on_progress:
+                                on_progress(stream, chunk, total_size - offset)
+                            controller.check_progress(request_bytes, now - request_start)
+                        if offset <= end:
+                            raise StallDetectedError("Connection closed before the range was complete")
+                controller.record(request_bytes, time.monotonic() - request_start)
+                attempt = 0
+            except HTTPError as e:
+                if e.code not in RETRYABLE_STATUS_CODES:
+                    raise # Expired URL or a real server error; retrying the range won't help
+                error = e
+                retry_after = parse_retry_after(e.headers.get("Retry-After"))
+            except (StallDetectedError, socket.timeout, TimeoutError, URLError,
+                    IncompleteRead, ConnectionError) as e:
+                error = e
+            else:
+                continue
+
+            controller.record(request_bytes, time.monotonic() - request_start)
+            controller.on_stall()
+            attempt += 1
+            if attempt > controller.max_retries:
+                raise StallDetectedError(
+                    f"Giving up after {controller.max_retries} retries at byte {offset}: {error}") from error
+            delay = controller.backoff_delay(attempt)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, limiter.max_pause)) # Same cap the limiter applies
+            # Waking up before the limiter's throttle pause ends would only queue for the slot
+            delay = max(delay, limiter.pause_remaining())
+            if on_status:
+                on_status(f"Transfer interrupted ({error}). Retrying from "
+                          f"{offset / (1024 * 1024):.1f} MiB in {delay:.0f}s...")
+            _interruptible_sleep(delay, should_continue)
+
+    return file_path
+
+
+def _interruptible_sleep(seconds, should_continue):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if not should_continue():
+            raise InterruptedError("Download cancelled by user.")
+        time.sleep(max(0.0, min(0.1, deadline - time.monotonic())))
@@ -1,17 +1,37 @@
 # YTDownloaderPro/ytdownloader/core/youtube_handler.py
 from pytubefix import YouTube
-from pytubefix.exceptions import RegexMatchError, VideoUnavailable, PytubeFixError, AgeRestrictedError
+from pytubefix.exceptions import (
+    RegexMatchError, VideoUnavailable, PytubeFixError, AgeRestrictedError, BotDetection
+)
+from ..utils.tracing import span
+from .concurrency import AdaptiveConcurrencyController, ThrottledError
 
-def get_video_info(url):
+# Shared by every metadata fetch so bulk lookups back off together when YouTube throttles
+metadata_limiter = AdaptiveConcurrencyController(
+    "metadata", initial_limit=2, max_limit=8,
+    throttle_exceptions=(BotDetection,),
+    ignored_exceptions=(RegexMatchError, VideoUnavailable)
+)
+# A fetch waits out short throttle pauses but reports longer ones to the user
+METADATA_MAX_WAIT = 10
+
+
+def get_video_info(url, should_continue=None):
     """
     Fetches video information from a YouTube URL using pytubefix.
+    should_continue() returning False cancels a wait for a request slot.
 
     Returns:
         dict: A dictionary containing video information or an error message.
     """
     try:
-        yt = YouTube(url)
-        _ = yt.title # Access title to ensure metadata is loaded and video is accessible
+        with metadata_limiter.slot(should_continue, max_wait=METADATA_MAX_WAIT):
+            with span("YouTube(url)"):
+                yt = YouTube(url)
+            with span("fetch metadata"):
+                _ = yt.title # Access title to ensure metadata is loaded and video is accessible
+            with span("load streams (signature decipher)"):
+                _ = yt.streams # First access fetches the player JS and deciphers stream URLs
 
         video_info = {
             "success": True,
@@ -62,8 +82,14 @@ def get_video_info(url):
 
         return video_info
 
+    except ThrottledError as e:
+        return {"success": False, "error": f"YouTube is throttling requests. Please retry in {e.retry_in:.0f} s."}
+    except InterruptedError:
+        return {"success": False, "error": "Fetch cancelled."}
     except RegexMatchError:
         return {"success": False, "error": "Invalid YouTube URL format."}
+    except BotDetection: # Subclass of VideoUnavailable, so it must come first
+        return {"success": False, "error": "YouTube is throttling requests (bot detection). Please try again later."}
     except VideoUnavailable:
         return {"success": False, "error": "Video is unavailable (private, deleted, or restricted)."}
     except AgeRestrictedError:
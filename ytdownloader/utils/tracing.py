@@ -0,0 +1,158 @@
+# YTDownloaderPro/ytdownloader/utils/tracing.py
+import os
+import json
+import time
+import threading
+import contextlib
+
+# Set to a directory to write one Chrome/Perfetto trace JSON file per run
+TRACE_DIR_ENV = "YTDOWNLOADER_TRACE_DIR"
+# Set to a job name (substring of the output filename) or "*" to profile that job
+PROFILE_JOB_ENV = "YTDOWNLOADER_PROFILE_JOB"
+# Where profile artifacts go; defaults to the trace dir, then the current directory
+PROFILE_DIR_ENV = "YTDOWNLOADER_PROFILE_DIR"
+
+TRACEMALLOC_TOP_N = 25
+
+
+class Tracer:
+    """
+    Collects complete ("X") events in the Chrome trace event format, which
+    chrome://tracing and ui.perfetto.dev both load directly.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._events = []
+        self._named_threads = set()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Records the time spent inside the block as a span on the current thread."""
+        if not self.enabled:
+            yield
+            return
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            self._add_event(name, start, self._now_us() - start, args)
+
+    def counter(self, name, **values):
+        """Records numeric values as a counter ("C") event, drawn as a graph track."""
+        if not self.enabled:
+            return
+        self._append({"name": name, "ph": "C", "ts": self._now_us(), "pid": self._pid,
+                      "tid": threading.current_thread().ident, "args": values})
+
+    def _add_event(self, name, start_us, duration_us, args):
+        self._append({"name": name, "ph": "X", "ts": start_us, "dur": duration_us,
+                      "pid": self._pid, "tid": threading.current_thread().ident,
+                      "args": {k: str(v) for k, v in args.items()}})
+
+    def _append(self, event):
+        thread = threading.current_thread()
+        tid = thread.ident
+        with self._lock:
+            if tid not in self._named_threads:
+                self._named_threads.add(tid)
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid,
+                                     "tid": tid, "args": {"name": thread.name}})
+            self._events.append(event)
+
+    def export(self, file_path):
+        """Writes the collected events as a trace JSON file."""
+        with self._lock:
+            events = list(self._events)
+        with open(file_path, "w", encoding="utf-8") as fh:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh)
+        return file_path
+
+
+_tracer = Tracer(enabled=bool(os.environ.get(TRACE_DIR_ENV)))
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, **args):
+    """Shorthand for get_tracer().span(...)."""
+    return _tracer.span(name, **args)
+
+
+def export_trace():
+    """
+    Writes this run's trace into the directory named by YTDOWNLOADER_TRACE_DIR.
+
+    Returns:
+        str or None: Path of the trace file, or None if tracing is disabled.
+    """
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    if not trace_dir or not _tracer.enabled:
+        return None
+    os.makedirs(trace_dir, exist_ok=True)
+    file_name = f"trace_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.json"
+    return _tracer.export(os.path.join(trace_dir, file_name))
+
+
+def _should_profile(job_name):
+    wanted = os.environ.get(PROFILE_JOB_ENV)
+    if not wanted:
+        return False
+    return wanted == "*" or wanted.lower() in job_name.lower()
+
+
+@contextlib.contextmanager
+def profile_job(job_name):
+    """
+    Runs the block under cProfile and tracemalloc if YTDOWNLOADER_PROFILE_JOB
+    selects this job, then writes a .prof file and a memory report for it.
+    cProfile only sees the calling thread, which is the worker running the job.
+    """
+    if not _should_profile(job_name):
+        yield
+        return
+
+    import cProfile
+    import tracemalloc
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+        # Runs at the end of a worker thread; an unwritable directory must not take the app down
+        try:
+            out_dir = os.environ.get(PROFILE_DIR_ENV) or os.environ.get(TRACE_DIR_ENV) or os.getcwd()
+            os.makedirs(out_dir, exist_ok=True)
+            safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in job_name)[:60]
+            base = os.path.join(out_dir, f"profile_{safe_name}_{time.strftime('%Y%m%d_%H%M%S')}")
+
+            profiler.dump_stats(f"{base}.prof") # Open with snakeviz or pstats
+            with open(f"{base}_memory.txt", "w", encoding="utf-8") as fh:
+                fh.write(f"Job: {job_name}\n")
+                fh.write(f"Current traced memory: {current / (1024 * 1024):.1f} MiB\n")
+                fh.write(f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB\n\n")
+                fh.write(f"Top {TRACEMALLOC_TOP_N} allocation sites:\n")
+                for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_N]:
+                    fh.write(f"{stat}\n")
+            print(f"Profile for '{job_name}' written to {base}.prof and {base}_memory.txt")
+        except OSError as e:
+            print(f"Could not write profile for '{job_name}': {e}")